@@ -0,0 +1,139 @@
+"""
+Pure-Python note conversion helpers (markdown <-> Anki HTML, note parsing).
+
+Kept free of I/O and third-party imports so the module can optionally be
+compiled with mypyc (`mypyc note_format.py`); the compiled extension is then
+picked up automatically in place of this file.
+"""
+
+import re
+from typing import Dict, Match, Optional, Tuple
+
+# Pre-compiled patterns for note conversion (compiled once at import)
+_BOLD_RE = re.compile(r"\*\*(.*?)\*\*")
+_ITAL_RE = re.compile(r"(?<!\*)\*([^*\n]+?)\*(?!\*)")
+# Leading indentation plus an optional list marker on every line; group 3 is empty for blank lines
+_LINE_PREFIX_RE = re.compile(r"^([^\S\n]*)([\*-][^\S\n]+)?(?=(.?))", re.MULTILINE)
+_HEADER_RE = re.compile(r"^\s*[\*-]\s+\*\*(.*?)\*\*(.*)")
+_GRAMMAR_RE = re.compile(r"###\s*Grammar:", re.IGNORECASE)
+
+# Anki HTML -> console markdown substitutions, applied in a single pass
+_HTML_SUBS: Dict[str, str] = {"<br>": "\n", "&nbsp;": " ", "<b>": "**", "</b>": "**", "<i>": "*", "</i>": "*"}
+_HTML_RE = re.compile("|".join(map(re.escape, _HTML_SUBS)))
+
+
+def _line_prefix_to_html(match: Match[str]) -> str:
+    """Replacement for _LINE_PREFIX_RE: indentation as &nbsp; (capped), list marker dropped, blank lines as <br>."""
+    indent, marker, next_char = match.groups()
+    if not next_char and not marker:
+        # A blank line becomes a <br> of its own, on top of the ones its newlines turn into
+        return "<br>"
+    indent_html = "&nbsp;" * min(len(indent), 8)  # Cap at reasonable level
+    # Without a list marker the original whitespace is kept after the &nbsp; prefix
+    return indent_html if marker else indent_html + indent
+
+
+def _markdown_to_html_for_anki(text: str) -> str:
+    """
+    Converts markdown to HTML for Anki cards.
+    Preserves formatting for vocabulary notes including:
+    - Bold text (**word** -> <b>word</b>)
+    - Italic text (*text* -> <i>text</i>)
+    - Nested lists (conjugations, examples)
+    - Indentation for structured content
+    """
+    if not text:
+        return ""
+
+    # Convert **bold** to <b>bold</b> first (before processing italic)
+    text = _BOLD_RE.sub(r"<b>\1</b>", text)
+    # Convert *italic* to <i>italic</i> (single asterisks that aren't part of **bold**)
+    # This pattern matches single * that aren't preceded or followed by another *
+    text = _ITAL_RE.sub(r"<i>\1</i>", text)
+
+    # Handle list markers and indentation for every line in one pass:
+    # the marker (- or *) is dropped and leading spaces/tabs become non-breaking spaces
+    text = _LINE_PREFIX_RE.sub(_line_prefix_to_html, text)
+
+    # Turn newlines into <br> and clean up multiple consecutive <br> tags
+    result = text.replace("\n", "<br>")
+    # Max 2 consecutive breaks; plain substring checks are much cheaper than a regex here
+    while "<br><br><br>" in result:
+        result = result.replace("<br><br><br>", "<br><br>")
+
+    return result.strip()
+
+
+def _html_token_to_markdown(match: Match[str]) -> str:
+    """Replacement for _HTML_RE: maps one HTML token to its markdown equivalent."""
+    return _HTML_SUBS[match.group(0)]
+
+
+def html_to_markdown_for_console(html_text: str) -> str:
+    """
+    Converts Anki-formatted HTML back to a readable string for the console.
+    This is necessary because the existing notes are stored as HTML in the CSV/cache,
+    but Rich Markdown renderer expects Markdown or plain text, not <br> tags.
+    """
+    if not html_text:
+        return ""
+
+    # One scan replaces <br>, &nbsp;, <b>/</b> (-> **) and <i>/</i> (-> *)
+    return _HTML_RE.sub(_html_token_to_markdown, html_text)
+
+
+def parse_note_for_anki(note_content: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Parses a full note block (which could be multi-line) to extract vocabulary for Anki.
+
+    Vocabulary notes should include:
+    - Gender (for nouns): (masc.), (fem.), (neut.)
+    - Meaning/definition: the English translation
+    - Conjugation (for verbs): Präsens, Präteritum, Partizip II
+    - Examples: usage examples in German with translations
+
+    Returns (front, back) for vocabulary notes, or (None, None) for grammar notes.
+    Grammar notes are explicitly detected and skipped.
+    """
+    note_content = note_content.strip()
+    # Only the first 3 lines are inspected line by line; the body is sliced off the
+    # original string instead of being split into lines and joined back together
+    lines = note_content.split("\n", 3)[:3]
+
+    # Explicit grammar detection: check if note starts with "### Grammar:" or contains "Grammar:" header
+    first_line_lower = lines[0].strip().lower()
+    if "### grammar:" in first_line_lower or first_line_lower.startswith("### grammar"):
+        return None, None, "grammar"
+
+    # Check if any line contains a grammar header pattern
+    for line in lines:  # Check first 3 lines for grammar indicators
+        # Cheap substring checks first; vocabulary notes almost never get as far as the regex
+        if "###" in line and "grammar" in line.lower() and _GRAMMAR_RE.search(line):
+            return None, None, "grammar"
+
+    # Vocabulary detection: look for bolded German word/phrase
+    # Pattern matches: "- **der Wal** (masc.): whale" or "* **wissen** (verb): to know"
+    header_match = _HEADER_RE.match(lines[0])
+
+    if header_match:
+        # Front = The bolded German word/phrase (e.g., "der Wal", "wissen")
+        front = header_match.group(1).strip()
+
+        # Back = ALL content from the note:
+        # - First line remainder: gender, type, meaning (e.g., "(masc.): whale")
+        # - All subsequent lines: conjugations, examples, additional info
+        back_part1 = header_match.group(2).strip()
+        back_part2 = note_content.partition("\n")[2].strip()
+
+        # Combine all content to ensure nothing is lost
+        # This captures: gender, meaning, conjugations (Präsens, Präteritum, Partizip II), examples
+        full_back_content = f"{back_part1}\n{back_part2}".strip()
+
+        # Convert the complete "back" content to HTML for Anki
+        # This preserves all formatting: bold, italic, lists, indentation
+        back_html = _markdown_to_html_for_anki(full_back_content)
+
+        return front, back_html, None
+
+    # If no vocabulary pattern found, it's not a vocabulary note
+    return None, None, None
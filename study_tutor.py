@@ -1,17 +1,37 @@
 import os
 import os.path
+import re
 import time
+import random
+import pickle
+import hashlib
+import sqlite3
+import io
+import functools
+import asyncio
+import threading
 from dotenv import load_dotenv
-import re
 import json
-import urllib.request
+import requests
 from google import genai
 from google.genai import types
 from rich.console import Console
 from rich.markdown import Markdown
 from prompt_toolkit import PromptSession
 from prompt_toolkit.history import InMemoryHistory
-from typing import List
+from note_format import html_to_markdown_for_console, parse_note_for_anki
+
+try:
+    import orjson  # Optional: much faster parsing of large AnkiConnect responses
+except ImportError:
+    orjson = None
+
+try:
+    # Optional: lets the tutor see which of your existing notes relate to a question
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
 
 # --- 1. Configuration ---
 
@@ -36,13 +56,51 @@ ANKI_CONNECT_URL = "http://localhost:8765"
 ANKI_DECK_NAME = "Default"
 ANKI_MODEL_NAME = "Basic"
 RETRY_COUNT = 3
+EXIT_COMMANDS = frozenset({"quit", "exit"})
+# Accepted answers for the interactive prompts (Enter alone means yes)
+YES_CHOICES = frozenset({"y", ""})
+NO_CHOICES = frozenset({"n"})
+DETAIL_CHOICES = frozenset({"d"})
+KEEP_CHOICES = frozenset({"k"})
+OVERWRITE_CHOICES = frozenset({"o"})
+QUIT_CHOICES = frozenset({"q", "quit"})
+# Differences in these never make two fronts different words (see _normalize_front)
+GERMAN_ARTICLES = frozenset({"der", "die", "das"})
+FRONT_TRAILING_PUNCTUATION = ".,;:!?"
+PROPOSED_NOTE_TAG = "[PROPOSED_NOTE]:"
+CARD_FEEDBACK_TAG = "[CARD_FEEDBACK]:"
+YOMITAN_CONCURRENCY = 4  # Max batches checked by the model at the same time
+ANKI_CACHE_FILE = ".anki_cache.pkl"
+ANKI_CACHE_VERSION = 3
+LLM_CACHE_FILE = ".llm_cache.sqlite3"
+LLM_CACHE_TTL = 30 * 24 * 60 * 60  # Cached answers expire after 30 days
+EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDING_CACHE_FILE = ".embedding_cache.pkl"
+KNOWN_VOCAB_THRESHOLD = 0.6  # Minimum cosine similarity for a note to count as related
+KNOWN_VOCAB_TOP_K = 10
 
 # Initialize Rich Console
 console = Console()
 
+# Pooled HTTP session for AnkiConnect (keeps the localhost connection alive between calls)
+_ANKI_SESSION = requests.Session()
+
+# Whitespace the model doesn't need: trailing spaces, and repeated spaces inside a line
+_TRAILING_SPACES_RE = re.compile(r"[ \t]+$", re.MULTILINE)
+_INNER_SPACES_RE = re.compile(r"(?<=\S)[ \t]{2,}(?=\S)")
+
+
+def _compact_prompt(text):
+    """Trims prompt whitespace, keeping the leading indentation that nests the lists."""
+    text = _TRAILING_SPACES_RE.sub("", text)
+    return _INNER_SPACES_RE.sub(" ", text).strip()
+
+
 # --- SYSTEM INSTRUCTION (No change) ---
+@functools.lru_cache(maxsize=2)
 def get_system_instruction(is_check_yomitan: bool):
-    return f"""
+    # Compacted once per variant: the instruction is sent (and billed) with every request
+    return _compact_prompt(f"""
 You are a helpful German Language Tutor. Your primary goal is to help me learn 
 and expand my personal 'My German Notes' knowledge base. You have to explain 
 all grammar and vocabulary in English.
@@ -58,7 +116,7 @@ When I ask a question:
     - **CONSTRAINT**: You MUST NOT prepare a proposal for grammar rules, only make explanations for grammar rules in the answer.
 3.  You MUST create a separate proposal for EACH new item.
 4.  You MUST format EACH proposal on its OWN new line, starting
-    with the exact tag "{ "[CARD_FEEDBACK]:" if is_check_yomitan else "[PROPOSED_NOTE]:" }".
+    with the exact tag "{CARD_FEEDBACK_TAG if is_check_yomitan else PROPOSED_NOTE_TAG}".
 5.  **IMPORTANT:** All proposals MUST be formatted in proper Markdown syntax:
     - Use `**bold**` for German words and grammar terms
     - Use `*italic*` for examples and emphasis
@@ -68,11 +126,11 @@ When I ask a question:
 Example of a correct response with multiple proposals in Markdown:
 <The model's answer to the user's question>
 
-{"[CARD_FEEDBACK]:" if is_check_yomitan else "[PROPOSED_NOTE]:"}
+{CARD_FEEDBACK_TAG if is_check_yomitan else PROPOSED_NOTE_TAG}
 - **die Ankunft** (fem.): arrival
 - Example: *Die Ankunft des Zuges ist um 14:30 Uhr.*
 
-{"[CARD_FEEDBACK]:" if is_check_yomitan else "[PROPOSED_NOTE]:"}
+{CARD_FEEDBACK_TAG if is_check_yomitan else PROPOSED_NOTE_TAG}
 - wissen;(reg. verb): to know (a fact, information)
 - Conjugation (present tense):
     - ich weiß
@@ -86,7 +144,7 @@ Example of a correct response with multiple proposals in Markdown:
     - Auxiliary verb: haben
 - Explanation: The past tense of 'wissen' is 'wusste' and the partizip II is 'gewusst'.
 - Example: Ich weiß die Antwort. (I know the answer.)
-"""
+""")
 
 # --- 2. Helper Functions (Now fully corrected) ---
 
@@ -94,275 +152,597 @@ Example of a correct response with multiple proposals in Markdown:
 def _wait_for_operation(operation):
     """Waits for a file processing operation to complete."""
     print("Processing file... (this may take a minute on first upload)")
-    # Use operation.done attribute to check completion status
+    # Use operation.done attribute to check completion status.
+    # Poll with exponential backoff (0.2, 0.4, 0.8, ... capped at 5 seconds) so fast operations return quickly,
+    # with jitter so several waiting operations don't poll in lockstep
+    delay = 0.2
     while not operation.done:
-        time.sleep(5)
+        time.sleep(delay * random.uniform(0.5, 1.0))
+        delay = min(delay * 2, 5.0)
         # Refresh the operation status
         operation = client.operations.get(operation)
     # Check for errors after operation is done
-    if hasattr(operation, "error") and operation.error:
-        raise Exception(f"Operation failed: {operation.error}")
+    error = getattr(operation, "error", None)
+    if error:
+        raise Exception(f"Operation failed: {error}")
     print("File processing Succeeded.")
 
 
-def render_note_to_console(title, content, style="bold green"):
+_llm_cache_db = None
+
+
+def _get_llm_cache_db():
+    """Opens (and creates on first use) the SQLite database holding cached model responses."""
+    global _llm_cache_db
+    if _llm_cache_db is None:
+        # Also read from the event loop thread while Yomitan batches are generated; the main
+        # thread is waiting on those batches then, so the connection is never used concurrently
+        _llm_cache_db = sqlite3.connect(LLM_CACHE_FILE, check_same_thread=False)
+        _llm_cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, created REAL)"
+        )
+        # Drop expired answers so the file doesn't keep growing
+        _llm_cache_db.execute("DELETE FROM responses WHERE created < ?", (time.time() - LLM_CACHE_TTL,))
+        _llm_cache_db.commit()
+    return _llm_cache_db
+
+
+def _llm_cache_key(model, contents, config):
+    """Hashes everything that determines the model's answer into a cache key."""
+    system_instruction = config.system_instruction if config else ""
+    return hashlib.sha256(f"{model}\0{system_instruction}\0{contents}".encode("utf-8")).hexdigest()
+
+
+def _llm_cache_get(key):
+    """Returns the cached response for key, or None if missing or expired."""
+    try:
+        row = _get_llm_cache_db().execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        print(f"Warning: Could not read response cache: {e}")
+        return None
+    if row and time.time() - row[1] < LLM_CACHE_TTL:
+        return row[0]
+    return None
+
+
+def _finished_normally(response):
+    """True if the model ended the response itself (not cut off by the token limit, a safety stop, etc.)."""
+    candidates = getattr(response, "candidates", None)
+    return bool(candidates) and candidates[0].finish_reason == types.FinishReason.STOP
+
+
+def _llm_cache_put(key, response_text):
+    """Stores a model response in the cache."""
+    try:
+        db = _get_llm_cache_db()
+        db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, response_text, time.time()))
+        db.commit()
+    except sqlite3.Error as e:
+        print(f"Warning: Could not write response cache: {e}")
+
+
+def cached_generate(model, contents, config, on_text=None, refresh=False):
+    """
+    Returns the model's response text for a prompt.
+    Repeated prompts (same model, system instruction and contents) are answered from
+    the local cache without calling the API, unless refresh is set; the fresh answer
+    then replaces the cached one. Only complete answers are cached.
+    If on_text is given, the response is streamed and on_text is called with each piece
+    of text as it arrives (once with the full text on a cache hit).
+    """
+    key = _llm_cache_key(model, contents, config)
+    if not refresh:
+        cached = _llm_cache_get(key)
+        if cached is not None:
+            if on_text:
+                on_text(cached)
+            return cached
+
+    if on_text is None:
+        final_response = client.models.generate_content(model=model, contents=contents, config=config)
+        response_text = final_response.text
+    else:
+        buffer = io.StringIO()
+        final_response = None
+        for chunk in client.models.generate_content_stream(model=model, contents=contents, config=config):
+            final_response = chunk
+            if chunk.text:
+                buffer.write(chunk.text)
+                on_text(chunk.text)
+        response_text = buffer.getvalue()
+
+    if response_text and _finished_normally(final_response):
+        _llm_cache_put(key, response_text)
+    return response_text
+
+
+async def cached_generate_async(model, contents, config):
+    """Async counterpart of cached_generate, sharing the same response cache."""
+    key = _llm_cache_key(model, contents, config)
+    cached = _llm_cache_get(key)
+    if cached is not None:
+        return cached
+
+    response = await client.aio.models.generate_content(model=model, contents=contents, config=config)
+    if response.text and _finished_normally(response):
+        _llm_cache_put(key, response.text)
+    return response.text
+
+
+_event_loop = None
+_event_loop_thread = None
+
+
+def _get_event_loop():
+    """
+    Returns the event loop used for async model calls, started on a background thread on first use.
+    A single loop is kept for the whole session because the client's async
+    HTTP connections are bound to the loop that opened them. Running it on a daemon
+    thread keeps input() on the main thread, so Ctrl-C and Ctrl-D behave as usual.
+    """
+    global _event_loop, _event_loop_thread
+    if _event_loop is None:
+        _event_loop = asyncio.new_event_loop()
+        _event_loop_thread = threading.Thread(target=_event_loop.run_forever, daemon=True)
+        _event_loop_thread.start()
+    return _event_loop
+
+
+def close_clients():
+    """Closes the model client's HTTP connections and stops the event loop thread, if it was started."""
+    global _event_loop, _event_loop_thread
+    if _event_loop is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(client.aio.aclose(), _event_loop).result(timeout=5)
+        except Exception as e:
+            print(f"Warning: Could not close the async client: {e}")
+        _event_loop.call_soon_threadsafe(_event_loop.stop)
+        _event_loop_thread.join(timeout=5)
+        if not _event_loop.is_running():
+            _event_loop.close()
+        _event_loop = None
+        _event_loop_thread = None
+    client.close()
+
+
+def _make_answer_printer(stop_tag, header):
+    """
+    Returns (write, finish) callbacks that print streamed text live until stop_tag appears.
+    Everything after the tag (the note proposals) is left for the caller to render.
+    A tail as long as the tag is held back so a tag split across chunks is never printed.
+    header is printed when the first text arrives; finish() returns whether anything was printed.
+    """
+    pending = ""
+    started = False
+    stopped = False
+
+    def write(text):
+        nonlocal pending, started, stopped
+        if stopped:
+            return
+        pending += text
+        if not started:
+            # Drop leading whitespace so the answer starts right under the "Tutor:" header
+            pending = pending.lstrip()
+            started = bool(pending)
+            if started:
+                print(header)
+
+        tag_pos = pending.find(stop_tag)
+        if tag_pos != -1:
+            print(pending[:tag_pos].rstrip(), end="", flush=True)
+            pending = ""
+            stopped = True
+            return
+
+        # Also hold back trailing whitespace so the answer never ends in blank lines
+        cut = len(pending[: max(0, len(pending) - (len(stop_tag) - 1))].rstrip())
+        if cut > 0:
+            print(pending[:cut], end="", flush=True)
+            pending = pending[cut:]
+
+    def finish():
+        nonlocal pending
+        if started:
+            print(pending.rstrip())
+        pending = ""
+        return started
+
+    return write, finish
+
+
+def render_note_to_console(title, content, style="bold green", plain=False):
     """
     Renders a note to the console using Rich.
     Args:
         title: The title of the note (e.g., "Existing Note", "New Note").
         content: The content of the note (markdown).
         style: The style for the title.
+        plain: Print the raw markdown text instead of parsing it (much cheaper for quick previews).
     """
     console.print(f"\n--- {title} ---", style=style)
-    console.print(Markdown(content))
+    if plain:
+        console.print(content, markup=False, highlight=False)
+    else:
+        console.print(Markdown(content))
     console.print("-" * 20, style="dim")
 
 
-def _markdown_to_html_for_anki(text):
+def anki_invoke(action, **params):
     """
-    Converts markdown to HTML for Anki cards.
-    Preserves formatting for vocabulary notes including:
-    - Bold text (**word** -> <b>word</b>)
-    - Italic text (*text* -> <i>text</i>)
-    - Nested lists (conjugations, examples)
-    - Indentation for structured content
+    Helper to invoke AnkiConnect actions.
+    Reuses a single keep-alive session so repeated calls skip the TCP handshake.
     """
-    if not text:
-        return ""
+    request_data = {"action": action, "version": 6, "params": params}
+
+    try:
+        if orjson:
+            request_json = orjson.dumps(request_data)
+        else:
+            request_json = json.dumps(request_data).encode("utf-8")
+        response = _ANKI_SESSION.post(
+            ANKI_CONNECT_URL, data=request_json, headers={"Content-Type": "application/json"}, timeout=30
+        )
+        res = orjson.loads(response.content) if orjson else json.loads(response.content)
 
-    # Split into lines to handle indentation and lists properly
-    lines = text.split("\n")
-    html_lines: List[str] = []
+        if not isinstance(res, dict):
+            raise Exception(f"Unexpected response type: {type(res)}")
 
-    for line in lines:
-        if not line.strip():
-            html_lines.append("<br>")
-            continue
+        if "error" in res and res["error"] is not None:
+            raise Exception(res["error"])
 
-        # Store original line for indentation calculation (before removing list markers)
-        original_line = line
+        if "result" not in res:
+            raise Exception("Response is missing 'result' field")
 
-        # Convert **bold** to <b>bold</b> first (before processing italic)
-        line = re.sub(r"\*\*(.*?)\*\*", r"<b>\1</b>", line)
-        # Convert *italic* to <i>italic</i> (single asterisks that aren't part of **bold**)
-        # This pattern matches single * that aren't preceded or followed by another *
-        line = re.sub(r"(?<!\*)\*([^*\n]+?)\*(?!\*)", r"<i>\1</i>", line)
+        return res["result"]
+    except Exception as e:
+        print(f"Error invoking AnkiConnect '{action}': {e}")
+        return None
 
-        # Handle list markers and indentation
-        # Count leading spaces/tabs for indentation (use original line before list marker removal)
-        indent_match = re.match(r"^(\s*)", original_line)
-        indent_level = len(indent_match.group(1)) if indent_match else 0
 
-        # Remove list markers (- or *) but preserve the rest of the line
-        # Only remove if it's at the start (after whitespace)
-        line = re.sub(r"^\s*[\*-]\s+", "", line)
+def anki_invoke_multi(actions):
+    """
+    Invokes several AnkiConnect actions in a single 'multi' request.
+    actions is a list of (action, params) pairs; returns a list of results aligned with it,
+    with None for any action that failed.
+    """
+    replies = anki_invoke(
+        "multi", actions=[{"action": action, "version": 6, "params": params} for action, params in actions]
+    )
+    if replies is None:
+        return [None] * len(actions)
+
+    results = []
+    for (action, _), reply in zip(actions, replies):
+        if reply.get("error") is not None:
+            print(f"Error invoking AnkiConnect '{action}': {reply['error']}")
+            results.append(None)
+        else:
+            results.append(reply.get("result"))
+    return results
 
-        # Add indentation as non-breaking spaces (2 spaces = 1 level of indentation)
-        if indent_level > 0:
-            indent_spaces = "&nbsp;" * min(indent_level, 8)  # Cap at reasonable level
-            line = indent_spaces + line
 
-        html_lines.append(line)
+def _deck_query(*filters):
+    """Builds a search query for the configured deck, optionally narrowed by extra search terms."""
+    return " ".join([f'deck:"{ANKI_DECK_NAME}"', *filters])
 
-    # Join with <br> and clean up multiple consecutive <br> tags
-    result = "<br>".join(html_lines)
-    result = re.sub(r"(<br>){3,}", "<br><br>", result)  # Max 2 consecutive breaks
 
-    return result.strip()
+def ensure_deck_exists():
+    """Checks if the configured deck exists, creates it if not."""
+    try:
+        decks = anki_invoke("deckNames")
+        if decks and ANKI_DECK_NAME not in decks:
+            print(f"Deck '{ANKI_DECK_NAME}' not found. Creating it...")
+            anki_invoke("createDeck", deck=ANKI_DECK_NAME)
+            print(f"Created deck '{ANKI_DECK_NAME}'.")
+    except Exception as e:
+        print(f"Could not ensure deck exists: {e}")
 
 
-def _html_to_markdown_for_console(html_text):
+def _fetch_notes(note_ids):
     """
-    Converts Anki-formatted HTML back to a readable string for the console.
-    This is necessary because the existing notes are stored as HTML in the CSV/cache,
-    but Rich Markdown renderer expects Markdown or plain text, not <br> tags.
+    Fetches note info for the given IDs from AnkiConnect.
+    Returns {noteId: {'front': front, 'back_html': html, 'back_md': markdown}}, with None for notes
+    lacking Front/Back fields. The console markdown form is rendered once here and kept in the
+    snapshot, so duplicate checks never convert existing notes again.
     """
-    if not html_text:
-        return ""
+    # Chunking keeps each notesInfo action small on very large decks. Several chunks share one
+    # 'multi' request to save round trips, but each request stays bounded so it finishes well
+    # within the HTTP timeout, and a failed request only loses its own chunks.
+    chunk_size = 500
+    chunks_per_request = 4
+    chunks = [note_ids[i : i + chunk_size] for i in range(0, len(note_ids), chunk_size)]
+    chunk_results = []
+    for i in range(0, len(chunks), chunks_per_request):
+        chunk_results.extend(
+            anki_invoke_multi([("notesInfo", {"notes": chunk}) for chunk in chunks[i : i + chunks_per_request]])
+        )
 
-    # Replace <br> with newlines
-    text = html_text.replace("<br>", "\n")
+    notes = {}
+    for notes_info in chunk_results:
+        if notes_info:
+            for note in notes_info:
+                # dependent on model having "Front" and "Back" fields
+                fields = note.get("fields", {})
+                front_field = fields.get("Front", {})
+                back_field = fields.get("Back", {})
+                entry = None
 
-    # Replace &nbsp; with spaces
-    text = text.replace("&nbsp;", " ")
+                if front_field and back_field:
+                    front_val = front_field.get("value", "").strip()
+                    back_val = back_field.get("value", "")
 
-    # Replace <b> and </b> with ** (or just remove if we want plain text, but ** is better for Rich)
-    text = text.replace("<b>", "**").replace("</b>", "**")
+                    if front_val:
+                        entry = {
+                            "front": front_val,
+                            "back_html": back_val,
+                            "back_md": html_to_markdown_for_console(back_val),
+                        }
 
-    # Replace <i> and </i> with *
-    text = text.replace("<i>", "*").replace("</i>", "*")
+                notes[note.get("noteId")] = entry
 
-    return text
+    return notes
 
 
-def _parse_note_for_anki(note_content):
+def _load_cache_snapshot():
+    """
+    Loads the on-disk snapshot written by a previous run.
+    Returns None if there is no snapshot or it was written for another deck/model/format.
     """
-    Parses a full note block (which could be multi-line) to extract vocabulary for Anki.
+    if not os.path.exists(ANKI_CACHE_FILE):
+        return None
+
+    try:
+        with open(ANKI_CACHE_FILE, "rb") as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        print(f"Warning: Could not read Anki cache snapshot: {e}")
+        return None
+
+    if (
+        not isinstance(snapshot, dict)
+        or snapshot.get("version") != ANKI_CACHE_VERSION
+        or snapshot.get("deck") != ANKI_DECK_NAME
+        or snapshot.get("model") != ANKI_MODEL_NAME
+    ):
+        return None
 
-    Vocabulary notes should include:
-    - Gender (for nouns): (masc.), (fem.), (neut.)
-    - Meaning/definition: the English translation
-    - Conjugation (for verbs): Präsens, Präteritum, Partizip II
-    - Examples: usage examples in German with translations
+    return snapshot
 
-    Returns (front, back) for vocabulary notes, or (None, None) for grammar notes.
-    Grammar notes are explicitly detected and skipped.
+
+def _save_cache_snapshot(notes, saved_at):
+    """
+    Writes the fetched notes to disk so the next startup only fetches new or edited notes.
+    saved_at is the time up to which every note in the snapshot is known to be current.
     """
-    lines = note_content.strip().split("\n")
-    if not lines:
-        return None, None, None
+    snapshot = {
+        "version": ANKI_CACHE_VERSION,
+        "deck": ANKI_DECK_NAME,
+        "model": ANKI_MODEL_NAME,
+        "saved_at": saved_at,
+        "notes": notes,
+    }
+    # Write to a temporary file and swap it in, so a crash mid-write never leaves a truncated snapshot
+    tmp_path = ANKI_CACHE_FILE + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(snapshot, f)
+        os.replace(tmp_path, ANKI_CACHE_FILE)
+    except Exception as e:
+        print(f"Warning: Could not write Anki cache snapshot: {e}")
+
+
+def load_anki_cache():
+    """
+    Loads existing Anki notes into a dictionary {front: {'back_html': html, 'back_md': markdown, 'id': noteId}}.
+    back_html is the Back field as stored in Anki; back_md is its console markdown form.
+    Using AnkiConnect to fetch notes from the specific deck.
+    Notes already in the on-disk snapshot are reused unless they were edited since it was written.
+    """
+    cache = {}
+    try:
+        ensure_deck_exists()
+        # Taken before the searches so edits made while fetching are picked up next time
+        started_at = time.time()
+
+        # 1. Find all notes in our deck and, if we have a snapshot, the ones edited since it was saved.
+        #    Both searches go out in one round trip.
+        snapshot = _load_cache_snapshot()
+        queries = [("findNotes", {"query": _deck_query()})]
+        if snapshot:
+            # Anki counts edited:N back from its next day rollover, not from now, so a note edited
+            # late on the day the snapshot was saved can fall outside edited:1 the next morning.
+            # One extra day covers that.
+            days = int((started_at - snapshot["saved_at"]) // 86400) + 2
+            queries.append(("findNotes", {"query": _deck_query(f"edited:{days}")}))
+        note_ids, *edited = anki_invoke_multi(queries)
 
-    # Explicit grammar detection: check if note starts with "### Grammar:" or contains "Grammar:" header
-    first_line_lower = lines[0].strip().lower()
-    if "### grammar:" in first_line_lower or first_line_lower.startswith("### grammar"):
-        return None, None, "grammar"
+        if not note_ids:
+            return cache
 
-    # Check if any line contains a grammar header pattern
-    for line in lines[:3]:  # Check first 3 lines for grammar indicators
-        if re.search(r"###\s*Grammar:", line, re.IGNORECASE):
-            return None, None, "grammar"
+        # 2. Work out which notes the snapshot can't answer for: new ones and ones edited since it was saved
+        known_notes = snapshot["notes"] if snapshot else {}
+        edited_ids = set()
+        if snapshot:
+            # If we can't tell what changed, refetch everything
+            edited_ids = set(edited[0]) if edited[0] is not None else set(note_ids)
 
-    # Vocabulary detection: look for bolded German word/phrase
-    # Pattern matches: "- **der Wal** (masc.): whale" or "* **wissen** (verb): to know"
-    header_match = re.search(r"^\s*[\*-]\s+\*\*(.*?)\*\*(.*)", lines[0])
+        missing_ids = [nid for nid in note_ids if nid not in known_notes or nid in edited_ids]
 
-    if header_match:
-        # Front = The bolded German word/phrase (e.g., "der Wal", "wissen")
-        front = header_match.group(1).strip()
+        # 3. Get note info for these IDs
+        fetched = _fetch_notes(missing_ids) if missing_ids else {}
+        known_notes.update(fetched)
 
-        # Back = ALL content from the note:
-        # - First line remainder: gender, type, meaning (e.g., "(masc.): whale")
-        # - All subsequent lines: conjugations, examples, additional info
-        back_part1 = header_match.group(2).strip()
-        back_part2 = "\n".join(lines[1:]).strip()
+        # Only move the snapshot forward if every note came back; otherwise notes that failed to
+        # refresh would keep their stale entries and fall out of the next edited: search
+        saved_at = started_at
+        if snapshot and any(nid not in fetched for nid in missing_ids):
+            saved_at = snapshot["saved_at"]
 
-        # Combine all content to ensure nothing is lost
-        # This captures: gender, meaning, conjugations (Präsens, Präteritum, Partizip II), examples
-        full_back_content = f"{back_part1}\n{back_part2}".strip()
+        # Drop notes that were deleted from the deck since the snapshot
+        notes = {nid: known_notes[nid] for nid in note_ids if nid in known_notes}
+        for note_id, entry in notes.items():
+            if entry:
+                # Store both back content and ID so we can update later
+                cache[entry["front"]] = {"back_html": entry["back_html"], "back_md": entry["back_md"], "id": note_id}
 
-        # Convert the complete "back" content to HTML for Anki
-        # This preserves all formatting: bold, italic, lists, indentation
-        back_html = _markdown_to_html_for_anki(full_back_content)
+        _save_cache_snapshot(notes, saved_at)
 
-        return front, back_html, None
+    except Exception as e:
+        print(f"Warning: Could not load Anki cache from AnkiConnect: {e}")
+        print("Make sure Anki is running and AnkiConnect is installed.")
 
-    # If no vocabulary pattern found, it's not a vocabulary note
-    return None, None, None
+    return cache
 
 
-def anki_invoke(action, **params):
+def _normalize_front(front):
     """
-    Helper to invoke AnkiConnect actions.
+    Key used to spot fronts that only differ in surrounding whitespace, trailing punctuation
+    or the capitalization of a leading article ("Der Wal." -> "der Wal").
+    The rest keeps its case: in German "arm"/"Arm" or "essen"/"Essen" are different words.
     """
-    request_data = {"action": action, "version": 6, "params": params}
-    request_json = json.dumps(request_data).encode("utf-8")
+    front = front.strip().rstrip(FRONT_TRAILING_PUNCTUATION).rstrip()
+    article, space, rest = front.partition(" ")
+    if space and article.lower() in GERMAN_ARTICLES:
+        return f"{article.lower()} {rest.lstrip()}"
+    return front
+
+
+def build_normalized_front_index(anki_notes_cache):
+    """Maps the normalized form of every cached front to the front as stored in Anki."""
+    return {_normalize_front(front): front for front in anki_notes_cache}
+
+
+def _load_embedding_cache():
+    """Returns the front embeddings saved by a previous run as {front: vector}, or {} if unusable."""
+    if not os.path.exists(EMBEDDING_CACHE_FILE):
+        return {}
 
     try:
-        req = urllib.request.Request(ANKI_CONNECT_URL, request_json)
-        with urllib.request.urlopen(req) as response:
-            res_content = response.read().decode("utf-8")
-            res = json.loads(res_content)
-            
-            if not isinstance(res, dict):
-                raise Exception(f"Unexpected response type: {type(res)}")
-            
-            if "error" in res and res["error"] is not None:
-                raise Exception(res["error"])
-            
-            if "result" not in res:
-                raise Exception("Response is missing 'result' field")
-                
-            return res["result"]
+        with open(EMBEDDING_CACHE_FILE, "rb") as f:
+            saved = pickle.load(f)
     except Exception as e:
-        print(f"Error invoking AnkiConnect '{action}': {e}")
-        return None
+        print(f"Warning: Could not read embedding cache: {e}")
+        return {}
 
+    if not isinstance(saved, dict) or saved.get("model") != EMBEDDING_MODEL_NAME:
+        return {}
 
-def ensure_deck_exists():
-    """Checks if the configured deck exists, creates it if not."""
+    return dict(zip(saved["fronts"], saved["embeddings"]))
+
+
+def _save_embedding_cache(fronts, embeddings):
+    """Writes the front embeddings to disk so the next startup only encodes new fronts."""
+    saved = {"model": EMBEDDING_MODEL_NAME, "fronts": fronts, "embeddings": embeddings}
+    tmp_path = EMBEDDING_CACHE_FILE + ".tmp"
     try:
-        decks = anki_invoke("deckNames")
-        if decks and ANKI_DECK_NAME not in decks:
-            print(f"Deck '{ANKI_DECK_NAME}' not found. Creating it...")
-            anki_invoke("createDeck", deck=ANKI_DECK_NAME)
-            print(f"Created deck '{ANKI_DECK_NAME}'.")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(saved, f)
+        os.replace(tmp_path, EMBEDDING_CACHE_FILE)
     except Exception as e:
-        print(f"Could not ensure deck exists: {e}")
+        print(f"Warning: Could not write embedding cache: {e}")
 
 
-def load_anki_cache():
+def build_front_index(anki_notes_cache):
     """
-    Loads existing Anki notes into a dictionary {front: {'back': back, 'id': noteId}}.
-    Using AnkiConnect to fetch notes from the specific deck.
+    Embeds the front of every cached note so questions can be matched against known vocabulary.
+    Embeddings from the previous run are reused, so only new fronts are encoded.
+    Returns None if sentence-transformers is not installed or the index could not be built.
     """
-    cache = {}
+    if SentenceTransformer is None:
+        return None
+
     try:
-        ensure_deck_exists()
+        model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        fronts = list(anki_notes_cache)
+        known = _load_embedding_cache()
+        missing = [front for front in fronts if front not in known]
+        if missing:
+            # Normalized embeddings make the dot product equal to cosine similarity
+            known.update(zip(missing, model.encode(missing, normalize_embeddings=True, convert_to_numpy=True)))
+
+        if fronts:
+            embeddings = np.stack([known[front] for front in fronts])
+        else:
+            embeddings = np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    except Exception as e:
+        print(f"Warning: Could not build vocabulary index: {e}")
+        return None
 
-        # 1. Find all notes in our deck
-        note_ids = anki_invoke("findNotes", query=f'deck:"{ANKI_DECK_NAME}"')
+    # Rewrite the cache when fronts were added or deleted, so it never outgrows the deck
+    # (but not when the deck came back empty, e.g. because Anki wasn't running)
+    if fronts and (missing or len(known) != len(fronts)):
+        _save_embedding_cache(fronts, embeddings)
 
-        if not note_ids:
-            return cache
+    return {"model": model, "fronts": fronts, "embeddings": embeddings}
 
-        # 2. Get note info for these IDs
-        # Chunking requests to avoid timeouts (User request: 100 per chunk, 0.5s buffer)
-        chunk_size = 100
-        for i in range(0, len(note_ids), chunk_size):
-            chunk = note_ids[i : i + chunk_size]
-            notes_info = anki_invoke("notesInfo", notes=chunk)
 
-            if notes_info:
-                for note in notes_info:
-                    # dependent on model having "Front" and "Back" fields
-                    fields = note.get("fields", {})
-                    front_field = fields.get("Front", {})
-                    back_field = fields.get("Back", {})
+def add_to_front_index(front_index, fronts):
+    """Embeds newly added fronts so they are recognized as known vocabulary for the rest of the session."""
+    if front_index is None or not fronts:
+        return
 
-                    if front_field and back_field:
-                        front_val = front_field.get("value", "").strip()
-                        back_val = back_field.get("value", "")
-                        note_id = note.get("noteId")
+    try:
+        embeddings = front_index["model"].encode(fronts, normalize_embeddings=True, convert_to_numpy=True)
+    except Exception as e:
+        print(f"Warning: Could not add notes to vocabulary index: {e}")
+        return
+
+    front_index["fronts"].extend(fronts)
+    front_index["embeddings"] = np.vstack([front_index["embeddings"], embeddings])
 
-                        if front_val:
-                            # Store both back content and ID so we can update later
-                            cache[front_val] = {"back": back_val, "id": note_id}
 
-            # Tiny buffer between chunks
-            time.sleep(0.5)
+def known_vocabulary_hint(front_index, question):
+    """
+    Returns a prompt suffix listing existing notes related to the question, so the
+    model doesn't propose them again. Empty string if nothing related is found.
+    """
+    if front_index is None:
+        return ""
 
+    try:
+        question_embedding = front_index["model"].encode(question, normalize_embeddings=True, convert_to_numpy=True)
     except Exception as e:
-        print(f"Warning: Could not load Anki cache from AnkiConnect: {e}")
-        print("Make sure Anki is running and AnkiConnect is installed.")
+        print(f"Warning: Could not look up known vocabulary: {e}")
+        return ""
 
-    return cache
+    scores = front_index["embeddings"] @ question_embedding
+    top_indices = np.argsort(scores)[::-1][:KNOWN_VOCAB_TOP_K]
+    known = [front_index["fronts"][i] for i in top_indices if scores[i] > KNOWN_VOCAB_THRESHOLD]
+    if not known:
+        return ""
+
+    return f"\n\nAlready-known vocabulary (do not propose notes for these): {', '.join(known)}"
 
 
-def save_note(note_content, response_notes, anki_notes_cache):
+def save_note(front, back, anki_notes_cache, normalized_fronts, pending_notes):
     """
-    Parses a single new note and checks for duplicates before saving to Anki via AnkiConnect.
+    Checks an already-parsed note for duplicates before saving it to Anki via AnkiConnect.
+    front/back are the values returned by parse_note_for_anki. Fronts that only differ in
+    whitespace, trailing punctuation or article case count as duplicates (see _normalize_front).
+    Overwrites are applied right away; new notes are queued in pending_notes and
+    added together by flush_notes. Returns the number of notes updated immediately.
     """
 
-    front, back, reason = _parse_note_for_anki(note_content)
-
     # If parsing failed (e.g., it was a grammar note), just stop.
     if not front:
         print("Not a valid note, skipping.")
         return 0
 
-    # Duplicate Detection
-    if front in anki_notes_cache:
-        # Get existing note data (now a dict with back and id)
-        existing_data = anki_notes_cache[front]
-        existing_back = existing_data.get("back", "")
+    # Duplicate Detection (against the front as stored in Anki, so "Der Wal." matches "der Wal")
+    normalized_front = _normalize_front(front)
+    existing_front = normalized_fronts.get(normalized_front)
+    if existing_front is not None:
+        # Get existing note data (a dict with back_html, back_md and id)
+        existing_data = anki_notes_cache[existing_front]
         note_id = existing_data.get("id")
 
-        # Prepare content for display
-        existing_back_md = _html_to_markdown_for_console(existing_back)
-        back_md = _html_to_markdown_for_console(back)
+        # Prepare content for display (existing notes are already converted on load)
+        existing_back_md = existing_data["back_md"]
+        back_md = html_to_markdown_for_console(back)
 
         # Render Existing Note
-        render_note_to_console("Existing Note", f"{front}\n\n{existing_back_md}", style="bold yellow")
+        render_note_to_console("Existing Note", f"{existing_front}\n\n{existing_back_md}", style="bold yellow")
 
         # Render New Note
         render_note_to_console("New Note", f"{front}\n\n{back_md}", style="bold green")
@@ -370,49 +750,85 @@ def save_note(note_content, response_notes, anki_notes_cache):
         valid_choice = False
         while not valid_choice:
             choice = input("Duplicate! (k)eep existing or (o)verwrite with new? ").lower().strip()
-            if choice == "o":
+            if choice in OVERWRITE_CHOICES:
                 valid_choice = True
                 # Overwrite Logic via AnkiConnect
                 try:
                     anki_invoke("updateNoteFields", note={"id": note_id, "fields": {"Front": front, "Back": back}})
                     print(f"✅ Updated entry in Anki (ID: {note_id}).")
-                    # Update cache
-                    anki_notes_cache[front]["back"] = back
+                    # Update cache (under the new front, in case its spelling changed)
+                    del anki_notes_cache[existing_front]
+                    anki_notes_cache[front] = {"back_html": back, "back_md": back_md, "id": note_id}
+                    normalized_fronts[normalized_front] = front
                     return 1
                 except Exception as e:
                     print(f"Error updating note in Anki: {e}")
                     return 0
-            elif choice == "k":
+            elif choice in KEEP_CHOICES:
                 valid_choice = True
                 print("Keeping existing note.")
                 return 0
             else:
                 print("Please enter 'k' or 'o'.")
 
-    # New Note Logic
+    # New Note Logic: queue it so all new notes from this response go out in one request
+    if any(_normalize_front(pending_front) == normalized_front for pending_front, _ in pending_notes):
+        print("This note is already queued, skipping.")
+        return 0
+    pending_notes.append((front, back))
+    return 0
+
+
+def flush_notes(pending_notes, anki_notes_cache, normalized_fronts, front_index):
+    """
+    Adds all queued new notes to Anki with one 'addNote' action each, sent in a single 'multi' request.
+    Returns the number of notes added and empties the queue.
+    """
+    if not pending_notes:
+        return 0
+
     try:
-        result = anki_invoke(
-            "addNote",
-            note={
-                "deckName": ANKI_DECK_NAME,
-                "modelName": ANKI_MODEL_NAME,
-                "fields": {"Front": front, "Back": back},
-                "options": {"allowDuplicate": False},
-                "tags": ["german_tutor"],
-            },
+        result = anki_invoke_multi(
+            [
+                (
+                    "addNote",
+                    {
+                        "note": {
+                            "deckName": ANKI_DECK_NAME,
+                            "modelName": ANKI_MODEL_NAME,
+                            "fields": {"Front": front, "Back": back},
+                            "options": {"allowDuplicate": False},
+                            "tags": ["german_tutor"],
+                        }
+                    },
+                )
+                for front, back in pending_notes
+            ]
         )
 
-        if result:
-            print(f"✅ Added new note to Anki deck '{ANKI_DECK_NAME}' (ID: {result}).")
-            anki_notes_cache[front] = {"back": back, "id": result}
-            return 1
-        else:
-            print("Failed to add note (AnkiConnect returned None).")
-            return 0
+        # One result per note, in order (None for notes that could not be added). Unlike 'addNotes',
+        # which raises for the whole batch if any note fails, a rejected note doesn't hide the others.
+        added_fronts = []
+        for (front, back), note_id in zip(pending_notes, result):
+            if note_id:
+                print(f"✅ Added new note '{front}' to Anki deck '{ANKI_DECK_NAME}' (ID: {note_id}).")
+                anki_notes_cache[front] = {
+                    "back_html": back,
+                    "back_md": html_to_markdown_for_console(back),
+                    "id": note_id,
+                }
+                normalized_fronts[_normalize_front(front)] = front
+                added_fronts.append(front)
+            else:
+                print(f"Failed to add note '{front}'.")
+        add_to_front_index(front_index, added_fronts)
+        return len(added_fronts)
 
     except Exception as e:
-        print(f"Error adding note to Anki: {e}")
+        print(f"Error adding notes to Anki: {e}")
         return 0
+    finally:
+        pending_notes.clear()
 
 
 def get_notes_by_tag(tag):
@@ -429,42 +845,27 @@ def get_notes_by_tag(tag):
         return []
 
 
-def check_yomitan_cards(client):
-    """
-    Fetches cards tagged 'yomitan', batches them by 10,
-    and asks the LLM to verify their explanations.
-    """
-    print("Fetching notes with tag 'yomitan'...")
-    notes = get_notes_by_tag("yomitan")
-
-    if not notes:
-        print("No notes found with tag 'yomitan'.")
-        return
-
-    print(f"Found {len(notes)} notes. Processing in batches of 10...")
+def _build_yomitan_prompt(batch):
+    """Builds the review prompt for one batch of yomitan notes. Returns (prompt, note_ids)."""
+    batch_content = []
+    note_ids = []
 
-    batch_size = 10
-    for i in range(0, len(notes), batch_size):
-        batch = notes[i : i + batch_size]
-        batch_content = []
-        note_ids = []
+    for note in batch:
+        note_id = note.get("noteId")
+        if note_id:
+            note_ids.append(note_id)
 
-        for note in batch:
-            note_id = note.get("noteId")
-            if note_id:
-                note_ids.append(note_id)
+        fields = note.get("fields", {})
+        # Yomitan cards often have 'Word' and 'Glossary', but we'll try Front/Back first
+        # as per existing codebase, but also check for typical Yomitan fields
+        front = fields.get("Front", {}).get("value") or fields.get("Word", {}).get("value", "No Word/Front")
+        back = fields.get("Back", {}).get("value") or fields.get("Glossary", {}).get("value", "No Back/Glossary")
 
-            fields = note.get("fields", {})
-            # Yomitan cards often have 'Word' and 'Glossary', but we'll try Front/Back first
-            # as per existing codebase, but also check for typical Yomitan fields
-            front = fields.get("Front", {}).get("value") or fields.get("Word", {}).get("value", "No Word/Front")
-            back = fields.get("Back", {}).get("value") or fields.get("Glossary", {}).get("value", "No Back/Glossary")
+        # Strip HTML for the prompt
+        back_plain = html_to_markdown_for_console(back)
+        batch_content.append(f"Word: {front}\nExplanation: {back_plain}")
 
-            # Strip HTML for the prompt
-            back_plain = _html_to_markdown_for_console(back)
-            batch_content.append(f"Word: {front}\nExplanation: {back_plain}")
-
-        prompt = f"""
+    prompt = f"""
         I have a batch of German vocabulary cards from Anki. 
         Please review each of the following cards and check if the explanation is accurate and helpful.
         If there are any errors or if the explanation could be significantly improved (e.g., missing gender, plural, or conjugations), please provide constructive feedback.
@@ -473,57 +874,93 @@ def check_yomitan_cards(client):
         {chr(10).join(batch_content)}
         
         Provide your feedback for each card individually. 
-        IMPORTANT: You MUST start the feedback for EVERY card with the tag `[CARD_FEEDBACK]:`.
+        IMPORTANT: You MUST start the feedback for EVERY card with the tag `{CARD_FEEDBACK_TAG}`.
         """
+    return prompt, note_ids
 
-        print(f"\n--- Checking Batch {(i // batch_size) + 1} of {(len(notes) + batch_size - 1) // batch_size} ---")
-        try:
-            response = client.models.generate_content(
+
+def check_yomitan_cards():
+    """
+    Fetches cards tagged 'yomitan', batches them by 10,
+    and asks the LLM to verify their explanations.
+    Every batch is sent to the model concurrently on the event loop thread, then the
+    user is walked through the results in order. Later batches keep generating while
+    the user reads earlier ones.
+    """
+    print("Fetching notes with tag 'yomitan'...")
+    notes = get_notes_by_tag("yomitan")
+
+    if not notes:
+        print("No notes found with tag 'yomitan'.")
+        return
+
+    print(f"Found {len(notes)} notes. Processing in batches of 10...")
+    batch_size = 10
+    batches = [_build_yomitan_prompt(notes[i : i + batch_size]) for i in range(0, len(notes), batch_size)]
+    config = types.GenerateContentConfig(system_instruction=get_system_instruction(is_check_yomitan=True))
+    semaphore = asyncio.Semaphore(YOMITAN_CONCURRENCY)
+
+    async def review(prompt):
+        async with semaphore:
+            return await cached_generate_async(
                 model="gemini-2.5-flash-lite",  # Use 2.0-flash as it's faster and reliable
                 contents=prompt,
-                config=types.GenerateContentConfig(
-                    system_instruction=get_system_instruction(is_check_yomitan=True)
-                ),
+                config=config,
             )
-            if response.text:
-                feedback_items = response.text.split("[CARD_FEEDBACK]:")
-                # First part might be general intro text, skip if empty or just whitespace
-                if not feedback_items[0].strip():
-                    feedback_items = feedback_items[1:]
-                
-                for idx, feedback in enumerate(feedback_items):
-                    feedback = feedback.strip()
-                    if not feedback:
-                        continue
-                        
-                    console.print(f"\n--- Feedback {idx + 1} of {len(feedback_items)} ---", style="bold cyan")
-                    console.print(Markdown(feedback))
-                    
-                    # Wait for user to press enter for next item
-                    if idx < len(feedback_items) - 1:
-                        input("\nPress Enter to see the next result...")
-                    else:
-                        print("\nEnd of batch results.")
-
-                # Remove the 'yomitan' tag from processed notes
-                if note_ids:
-                    # AnkiConnect 'removeTags' expects tags as a space-separated string
-                    result = anki_invoke("removeTags", notes=note_ids, tags="yomitan")
-                    if result is not None:
-                        print(f"Removed 'yomitan' tag from {len(note_ids)} notes.")
-                    else:
-                        print(f"Failed to remove 'yomitan' tag from {len(note_ids)} notes.")
 
-                # Wait for user input before next batch or exit
-                if i + batch_size < len(notes):
-                    choice = input("\nPress Enter to go to the next batch, or type 'q' to quit: ").lower().strip()
-                    if choice in ['q', 'quit']:
-                        print("Exiting Yomitan check.")
-                        break
-            else:
-                print("No response from the model for this batch.")
-        except Exception as e:
-            print(f"Error checking batch: {e}")
+    loop = _get_event_loop()
+    futures = [asyncio.run_coroutine_threadsafe(review(prompt), loop) for prompt, _ in batches]
+    try:
+        for batch_index, (future, (_, note_ids)) in enumerate(zip(futures, batches)):
+            print(f"\n--- Checking Batch {batch_index + 1} of {len(batches)} ---")
+            try:
+                response_text = future.result()
+                if response_text:
+                    feedback_items = response_text.split(CARD_FEEDBACK_TAG)
+                    # First part might be general intro text, skip if empty or just whitespace
+                    if not feedback_items[0].strip():
+                        feedback_items = feedback_items[1:]
+
+                    for idx, feedback in enumerate(feedback_items):
+                        feedback = feedback.strip()
+                        if not feedback:
+                            continue
+
+                        console.print(f"\n--- Feedback {idx + 1} of {len(feedback_items)} ---", style="bold cyan")
+                        console.print(Markdown(feedback))
+
+                        # Wait for user to press enter for next item
+                        if idx < len(feedback_items) - 1:
+                            input("\nPress Enter to see the next result...")
+                        else:
+                            print("\nEnd of batch results.")
+
+                    # Remove the 'yomitan' tag from processed notes
+                    if note_ids:
+                        # AnkiConnect 'removeTags' expects tags as a space-separated string
+                        result = anki_invoke("removeTags", notes=note_ids, tags="yomitan")
+                        if result is not None:
+                            print(f"Removed 'yomitan' tag from {len(note_ids)} notes.")
+                        else:
+                            print(f"Failed to remove 'yomitan' tag from {len(note_ids)} notes.")
+
+                    # Wait for user input before next batch or exit
+                    if batch_index < len(batches) - 1:
+                        choice = input("\nPress Enter to go to the next batch, or type 'q' to quit: ").lower().strip()
+                        if choice in QUIT_CHOICES:
+                            print("Exiting Yomitan check.")
+                            break
+                else:
+                    print("No response from the model for this batch.")
+            except EOFError:
+                # Input was closed (Ctrl-D): let the caller end the session
+                raise
+            except Exception as e:
+                print(f"Error checking batch: {e}")
+    finally:
+        # Don't leave requests for batches the user skipped running in the background
+        for future in futures:
+            future.cancel()
 
 
 
@@ -538,6 +975,8 @@ def main():
         # Configuration and Cache Loading
         anki_notes_cache = load_anki_cache()
         print(f"Loaded {len(anki_notes_cache)} notes from Anki cache.")
+        normalized_fronts = build_normalized_front_index(anki_notes_cache)
+        front_index = build_front_index(anki_notes_cache)
 
         print("\n--- 🤖 German Tutor is Ready ---")
         print("Ask me anything about German. Type 'quit' to exit.")
@@ -546,6 +985,10 @@ def main():
         # Create a PromptSession
         session = PromptSession(history=InMemoryHistory())
 
+        # The tutor config never changes within a session, so build it once
+        tutor_config = types.GenerateContentConfig(system_instruction=get_system_instruction(is_check_yomitan=False))
+        previous_question = None
+
         while True:
             try:
                 user_question = session.prompt("\nYou: ")
@@ -554,26 +997,39 @@ def main():
             except EOFError:
                 break
 
-            if user_question.lower() in ["quit", "exit"]:
-                client.close()
+            command = user_question.lower()
+            if command in EXIT_COMMANDS:
                 print("\nAuf Wiedersehen!")
                 break
 
-            if user_question.lower() == "check yomitan":
-                check_yomitan_cards(client)
+            if command == "check yomitan":
+                try:
+                    check_yomitan_cards()
+                except EOFError:
+                    break
                 continue
 
+            # Tell the model which related words are already in Anki
+            prompt = user_question + known_vocabulary_hint(front_index, user_question)
+
+            # Asking the same question twice in a row asks for a new answer instead of the cached one
+            refresh = user_question.strip() == previous_question
+            previous_question = user_question.strip()
+
             current_retry_count = 0
             while True:
                 try:
-                    response = client.models.generate_content(
+                    # Stream the answer as it arrives; proposals are rendered once the stream ends
+                    write_answer, finish_answer = _make_answer_printer(PROPOSED_NOTE_TAG, header="\nTutor:")
+                    response_text = cached_generate(
                         model="gemini-2.5-flash",
-                        contents=user_question,
-                        config=types.GenerateContentConfig(
-                            system_instruction=get_system_instruction(is_check_yomitan=False),
-                        ),
+                        contents=prompt,
+                        config=tutor_config,
+                        on_text=write_answer,
+                        refresh=refresh,
                     )
-                    if response.text:
+                    finish_answer()
+                    if response_text:
                         break
                     else:
                         print("No response from the model. Retrying...")
@@ -588,6 +1044,9 @@ def main():
                     # Check if it's a 503 error (service unavailable)
                     error_code = getattr(e, "code", None)
                     if error_code == 503:
+                        # The stream can fail after part of the answer was printed; say it starts over
+                        if finish_answer():
+                            print("(The answer was interrupted and will be restarted.)")
                         current_retry_count += 1
                         if current_retry_count < RETRY_COUNT:
                             wait_time = 2**current_retry_count  # Exponential backoff: 2, 4, 8 seconds
@@ -601,60 +1060,64 @@ def main():
                             raise e
                     else:
                         raise e
-            response_text = response.text
 
-            if "[PROPOSED_NOTE]:" not in response_text:
-                print(f"\nTutor:\n{response_text}")
+            # One scan splits off the proposals; the answer part was already printed while streaming
+            parts = response_text.split(PROPOSED_NOTE_TAG)
+            if len(parts) == 1:
                 continue
 
-            parts = response_text.split("[PROPOSED_NOTE]:")
-            tutor_answer = parts[0].strip()
-            proposed_notes = parts[1:]
+            # Parse every proposal once up front; the result drives both the badge and the save
+            proposals = []
+            for note_content in parts[1:]:
+                note_content = note_content.strip()
+                if note_content:
+                    proposals.append((note_content, *parse_note_for_anki(note_content)))
 
-            print(f"\nTutor:\n{tutor_answer}")
+            new_count = sum(1 for _, front, _, _ in proposals if front and _normalize_front(front) not in normalized_fronts)
+            existing_count = sum(1 for _, front, _, _ in proposals if front and _normalize_front(front) in normalized_fronts)
 
             print("\n---------------------------------")
-            print(f"Tutor has {len(proposed_notes)} new note proposal(s) for you:")
+            print(f"Tutor has {len(proposals)} note proposal(s) for you ({new_count} new, {existing_count} already in Anki):")
 
-            # Accumulate notes from this response
-            response_notes = []
             notes_saved_count = 0
-            for i, note_content in enumerate(proposed_notes, 1):
-                note_content = note_content.strip()
-                if not note_content:
-                    continue
-                print(f"\n--- Proposal {i} of {len(proposed_notes)} ---")
+            pending_notes = []
+            for i, (note_content, front, back, _) in enumerate(proposals, 1):
+                print(f"\n--- Proposal {i} of {len(proposals)} ---")
 
                 # Check for existence to add indicator
-                front_check, _, _ = _parse_note_for_anki(note_content)
                 title_suffix = ""
-                if front_check and front_check in anki_notes_cache:
+                if front and _normalize_front(front) in normalized_fronts:
                     title_suffix = " [EXISTING]"
 
-                render_note_to_console(f"Note {i}{title_suffix}", note_content, style="bold cyan")
+                # Show the raw text first; the Markdown parse is only paid for if the user asks for it
+                render_note_to_console(f"Note {i}{title_suffix}", note_content, style="bold cyan", plain=True)
 
                 should_ask_again = True
                 while should_ask_again:
-                    save_choice = input("Save this note? (y/n): ").lower().strip()
+                    save_choice = input("Save this note? (y/n, d for formatted view): ").lower().strip()
 
-                    if save_choice == "y" or save_choice == "":
+                    if save_choice in YES_CHOICES:
                         should_ask_again = False
-                        notes_saved_count += save_note(note_content, response_notes, anki_notes_cache)
-                    elif save_choice == "n":
+                        notes_saved_count += save_note(front, back, anki_notes_cache, normalized_fronts, pending_notes)
+                    elif save_choice in NO_CHOICES:
                         should_ask_again = False
+                    elif save_choice in DETAIL_CHOICES:
+                        render_note_to_console(f"Note {i}{title_suffix}", note_content, style="bold cyan")
                     else:
-                        print("Please enter 'y' or 'n'.")
+                        print("Please enter 'y', 'n' or 'd'.")
 
             # Save all notes from this response at once
+            notes_saved_count += flush_notes(pending_notes, anki_notes_cache, normalized_fronts, front_index)
             if notes_saved_count > 0:
                 saved_count = notes_saved_count
-                response_notes = []
                 notes_saved_count = 0
                 print(f"✅ Saved {saved_count} new note(s) to your file!")
 
     except Exception as e:
         print("\n--- An Error Occurred ---")
         print(e)
+    finally:
+        close_clients()
 
 
 if __name__ == "__main__":